@@ -1,6 +1,75 @@
-from PIL import Image
+from PIL import Image, features
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from turbojpeg import TurboJPEG, TJCS_GRAY, TJPF_BGR, TJPF_GRAY, TJSAMP_420, TJSAMP_GRAY
+    tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    tj = None
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+
+# Below this many images per worker, process startup costs more than the GIL
+# contention it avoids; libjpeg-turbo and Pillow release the GIL while coding
+PROCESS_POOL_MIN_JOBS_PER_WORKER = 4
+
+def _compress_with_turbojpeg(input_path, output_path, quality):
+    """Decode at 1/2 scale and re-encode through libjpeg-turbo directly, or return None if it can't"""
+    with open(input_path, 'rb') as f:
+        buf = f.read()
+    
+    # Non-JPEG inputs and JPEGs turbojpeg can't decode to BGR (e.g. CMYK) go through Pillow
+    if not buf.startswith(b'\xff\xd8'):
+        return None
+    
+    try:
+        width, height, _, colorspace = tj.decode_header(buf)
+        # Keep grayscale single-channel rather than expanding it to a colour JPEG
+        if colorspace == TJCS_GRAY:
+            pixel_format, subsample = TJPF_GRAY, TJSAMP_GRAY
+        else:
+            pixel_format, subsample = TJPF_BGR, TJSAMP_420
+        arr = tj.decode(buf, pixel_format=pixel_format, scaling_factor=(1, 2))
+    except OSError:
+        return None
+    
+    new_width = width // 2
+    new_height = height // 2
+    
+    if arr.shape[:2] != (new_height, new_width):
+        arr = arr[:new_height, :new_width].copy()
+    
+    with open(output_path, 'wb') as f:
+        f.write(tj.encode(arr, quality=quality, pixel_format=pixel_format, jpeg_subsample=subsample))
+    
+    return width, height, new_width, new_height
+
+def _compress_with_pillow(input_path, output_path, quality):
+    """Decode at reduced size via draft mode and re-encode through Pillow"""
+    with Image.open(input_path) as img:
+        width, height = img.size
+        
+        new_width = width // 2
+        new_height = height // 2
+        
+        # Let libjpeg scale by 1/2 in the IDCT instead of decoding the full raster
+        img.draft("RGB", (new_width, new_height))
+        img.load()
+        
+        if img.size == (new_width, new_height):
+            resized_img = img
+        elif img.size != (width, height):
+            # Odd dimensions decode at ceil(w/2) x ceil(h/2); crop the extra
+            # edge like the turbojpeg path instead of resampling every pixel
+            resized_img = img.crop((0, 0, new_width, new_height))
+        else:
+            resized_img = img.resize((new_width, new_height), Image.LANCZOS)
+        
+        resized_img.save(output_path, "JPEG", quality=quality)
+    
+    return width, height, new_width, new_height
 
 def compress_jpeg(input_path, output_path, quality=70):
     """
@@ -12,20 +81,17 @@ def compress_jpeg(input_path, output_path, quality=70):
         quality (int): JPEG quality (1-100), lower means more compression
     """
     try:
-        with Image.open(input_path) as img:
-            width, height = img.size
-            
-            new_width = width // 2
-            new_height = height // 2
-            
-            resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-            
-            resized_img.save(output_path, "JPEG", quality=quality)
-            
-            print(f"Successfully compressed image from {width}x{height} to {new_width}x{new_height}")
-            original_size = os.path.getsize(input_path) / 1024 
-            new_size = os.path.getsize(output_path) / 1024  
-            print(f"File size reduced from {original_size:.2f}KB to {new_size:.2f}KB")
+        sizes = None
+        if tj is not None:
+            sizes = _compress_with_turbojpeg(input_path, output_path, quality)
+        if sizes is None:
+            sizes = _compress_with_pillow(input_path, output_path, quality)
+        width, height, new_width, new_height = sizes
+        
+        print(f"Successfully compressed image from {width}x{height} to {new_width}x{new_height}")
+        original_size = os.path.getsize(input_path) / 1024 
+        new_size = os.path.getsize(output_path) / 1024  
+        print(f"File size reduced from {original_size:.2f}KB to {new_size:.2f}KB")
     
     except Exception as e:
         print(f"Error: {e}")
@@ -33,11 +99,44 @@ def compress_jpeg(input_path, output_path, quality=70):
     
     return True
 
+def compress_jpegs(paths, out_dir, quality=70, workers=None):
+    """
+    Compress many JPEG images in parallel, writing each under out_dir with its original name.
+    
+    Args:
+        paths (list): Paths to the input JPEG images
+        out_dir (str): Directory where the compressed images will be saved
+        quality (int): JPEG quality (1-100), lower means more compression
+        workers (int): Number of parallel workers, defaults to the CPU count
+    
+    Returns:
+        list: One success flag per input path, in order
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    output_paths = [os.path.join(out_dir, os.path.basename(path)) for path in paths]
+    
+    if len(paths) >= workers * PROCESS_POOL_MIN_JOBS_PER_WORKER:
+        executor_cls = ProcessPoolExecutor
+    else:
+        executor_cls = ThreadPoolExecutor
+    
+    with executor_cls(max_workers=workers) as executor:
+        return list(executor.map(compress_jpeg, paths, output_paths, [quality] * len(paths)))
+
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: python compress_jpeg.py <input_path> <output_path> [quality]")
+        print("Usage: python compress_jpeg.py <input_path|input_dir> <output_path|output_dir> [quality]")
         sys.exit(1)
     
+    if tj is None and not features.check_feature('libjpeg_turbo'):
+        print("Warning: Pillow is not built with libjpeg-turbo, JPEG decode/encode will be slower. See requirements.txt",
+              file=sys.stderr)
+    
     input_path = sys.argv[1]
     output_path = sys.argv[2]
     
@@ -51,4 +150,12 @@ if __name__ == "__main__":
         except ValueError:
             print("Invalid quality value, using default quality of 70")
     
-    compress_jpeg(input_path, output_path, quality)
\ No newline at end of file
+    if os.path.isdir(input_path):
+        paths = sorted(
+            os.path.join(input_path, name) for name in os.listdir(input_path)
+            if name.lower().endswith(JPEG_EXTENSIONS)
+        )
+        results = compress_jpegs(paths, output_path, quality)
+        print(f"Compressed {sum(results)} of {len(results)} images into {output_path}")
+    else:
+        compress_jpeg(input_path, output_path, quality)
\ No newline at end of file
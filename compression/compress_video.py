@@ -1,27 +1,329 @@
 import os
 import sys
+import json
+import hashlib
+import functools
+import itertools
 import subprocess
 import argparse
+import tempfile
 from pathlib import Path
 
-def get_video_duration(input_file):
-    """Get video duration in seconds using ffprobe"""
+@functools.lru_cache(maxsize=None)
+def _probe(input_file):
+    """Run ffprobe once per file and return its parsed format and stream info"""
     cmd = [
         'ffprobe', 
         '-v', 'error', 
-        '-show_entries', 'format=duration', 
-        '-of', 'default=noprint_wrappers=1:nokey=1', 
+        '-print_format', 'json', 
+        '-show_format', 
+        '-show_streams', 
         input_file
     ]
     
+    output = subprocess.check_output(cmd).decode('utf-8')
+    return json.loads(output)
+
+def probe_video(input_file):
+    """Get ffprobe format and stream info, cached per resolved path"""
+    return _probe(str(Path(input_file).resolve()))
+
+def get_video_duration(input_file):
+    """Get video duration in seconds using ffprobe"""
     try:
-        output = subprocess.check_output(cmd).decode('utf-8').strip()
-        return float(output)
-    except (subprocess.CalledProcessError, ValueError):
+        return float(probe_video(input_file)['format']['duration'])
+    except (subprocess.CalledProcessError, ValueError, KeyError):
         print("Error: Could not determine video duration.")
         return None
 
-def compress_video(input_file, target_size_mb=100, output_dir=None):
+def get_video_stream(input_file):
+    """Get the ffprobe info of the first video stream, or an empty dict if unknown"""
+    try:
+        streams = probe_video(input_file).get('streams', [])
+    except (subprocess.CalledProcessError, ValueError):
+        return {}
+    
+    for stream in streams:
+        if stream.get('codec_type') == 'video':
+            return stream
+    return {}
+
+def can_cuvid_decode(input_file):
+    """Check whether h264_cuvid can decode the input: NVDEC only handles 8-bit 4:2:0 H.264"""
+    stream = get_video_stream(input_file)
+    return stream.get('codec_name') == 'h264' and stream.get('pix_fmt') in ('yuv420p', 'yuvj420p')
+
+def get_audio_args(input_file, audio_bitrate="128k"):
+    """Stream-copy AAC audio at or below 160kbps, otherwise re-encode to AAC"""
+    try:
+        streams = probe_video(input_file).get('streams', [])
+    except (subprocess.CalledProcessError, ValueError):
+        streams = []
+    
+    audio_streams = [s for s in streams if s.get('codec_type') == 'audio']
+    if audio_streams and all(
+        s.get('codec_name') == 'aac' and 0 < int(s.get('bit_rate') or 0) <= 160000
+        for s in audio_streams
+    ):
+        return ['-c:a', 'copy']
+    
+    return ['-c:a', 'aac', '-b:a', audio_bitrate]
+
+@functools.lru_cache(maxsize=None)
+def has_nvenc():
+    """Check that h264_nvenc can actually encode on this machine, not just that ffmpeg lists it"""
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-f', 'lavfi',
+        '-i', 'nullsrc=s=256x256',
+        '-frames:v', '1',
+        '-c:v', 'h264_nvenc',
+        '-f', 'null',
+        '-'
+    ]
+    
+    try:
+        subprocess.run(cmd, capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+@functools.lru_cache(maxsize=None)
+def _numa_cpusets():
+    """Get the CPUs this process may use on each NUMA node, or an empty list if fewer than two nodes have any"""
+    if not hasattr(os, 'sched_setaffinity'):
+        return []
+    
+    # Respect cgroup cpusets and any taskset the user applied
+    allowed_cpus = os.sched_getaffinity(0)
+    
+    node_dirs = sorted(
+        Path('/sys/devices/system/node').glob('node[0-9]*'),
+        key=lambda d: int(d.name[len('node'):])
+    )
+    
+    cpusets = []
+    for node_dir in node_dirs:
+        try:
+            cpulist = (node_dir / 'cpulist').read_text().strip()
+        except OSError:
+            continue
+        
+        # Memory-only nodes have an empty cpulist
+        if not cpulist:
+            continue
+        
+        cpus = set()
+        for part in cpulist.split(','):
+            start, _, end = part.partition('-')
+            cpus.update(range(int(start), int(end or start) + 1))
+        
+        cpus &= allowed_cpus
+        if cpus:
+            cpusets.append(cpus)
+    
+    return cpusets if len(cpusets) > 1 else []
+
+# Starting from the pid spreads separate invocations across nodes as well as
+# successive encodes within one process
+_numa_node_counter = itertools.count(os.getpid())
+
+def _next_numa_cpuset():
+    """Pick the next NUMA node's CPUs round-robin, or None on single-node hosts"""
+    cpusets = _numa_cpusets()
+    if not cpusets:
+        return None
+    return cpusets[next(_numa_node_counter) % len(cpusets)]
+
+def _popen_ffmpeg(cmd, cpuset):
+    """Start ffmpeg with stdout piped, pinned to cpuset if given and pinning succeeds"""
+    if cpuset is not None:
+        try:
+            # Keep encoder threads on one node so motion search stays in its L3/memory
+            return subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True,
+                                    preexec_fn=lambda: os.sched_setaffinity(0, cpuset))
+        except subprocess.SubprocessError:
+            # sched_setaffinity failed in the child; pinning is only an optimisation
+            pass
+    
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+
+def run_ffmpeg(cmd, duration=None):
+    """Run an ffmpeg command, streaming its progress and pinning it to one NUMA node when there are several"""
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    
+    with _popen_ffmpeg(cmd, _next_numa_cpuset()) as p:
+        for line in p.stdout:
+            key, _, value = line.strip().partition('=')
+            # out_time_ms is reported in microseconds as well, despite its name
+            if key in ('out_time_us', 'out_time_ms') and duration and value.isdigit():
+                percent = min(int(value) / 1_000_000 / duration * 100, 100)
+                print(f"\rProgress: {percent:5.1f}%", end='', flush=True)
+            elif key == 'progress' and value == 'end' and duration:
+                print()
+    
+    if p.returncode != 0:
+        raise subprocess.CalledProcessError(p.returncode, cmd)
+
+CRF_CANDIDATES = [23, 26, 29, 32]
+CRF_SAMPLE_SECONDS = 30
+CRF_CACHE_DIR = Path.home() / '.cache' / 'compress_video'
+
+def _crf_cache_path(input_file, preset, tune):
+    """Cache file for CRF rate samples, keyed by codec, resolution, duration, content and encoder settings"""
+    info = probe_video(input_file)
+    video = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), {})
+    
+    with open(input_file, 'rb') as f:
+        head_sha1 = hashlib.sha1(f.read(1024 * 1024)).hexdigest()
+    
+    key = (
+        f"{video.get('codec_name')}:{video.get('width')}x{video.get('height')}:"
+        f"{info.get('format', {}).get('duration')}:{head_sha1}:{preset}:{tune}"
+    )
+    return CRF_CACHE_DIR / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json"
+
+def _sample_bytes_per_second(input_file, crf, sample_seconds, preset, tune):
+    """Encode the opening seconds at the given CRF and return the video bytes per second"""
+    # Same preset and tune as the final encode, since both shift bitrate at a given CRF
+    tune_args = ['-tune', tune] if tune else []
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-t', f'{sample_seconds}',
+        '-i', str(input_file),
+        '-an',
+        '-c:v', 'libx264',
+        '-preset', preset,
+        *tune_args,
+        '-crf', str(crf),
+        '-f', 'h264',
+        'pipe:1'
+    ]
+    
+    result = subprocess.run(cmd, capture_output=True, check=True)
+    return len(result.stdout) / sample_seconds
+
+def choose_crf(input_file, duration, video_size_bytes, preset='medium', tune=None):
+    """Pick the lowest candidate CRF whose sampled bitrate fits the video size budget"""
+    try:
+        cache_path = _crf_cache_path(input_file, preset, tune)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+    
+    try:
+        rates = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        rates = {}
+    
+    sample_seconds = min(CRF_SAMPLE_SECONDS, duration)
+    chosen_crf = None
+    
+    try:
+        for crf in CRF_CANDIDATES:
+            if str(crf) not in rates:
+                rates[str(crf)] = _sample_bytes_per_second(input_file, crf, sample_seconds, preset, tune)
+            
+            if rates[str(crf)] * duration <= video_size_bytes:
+                chosen_crf = crf
+                break
+    except subprocess.CalledProcessError:
+        return None
+    
+    try:
+        CRF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps(rates))
+    except OSError:
+        pass
+    
+    return chosen_crf
+
+X264_PRESETS = [
+    'ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
+    'medium', 'slow', 'slower', 'veryslow',
+]
+X264_TUNES = ['film', 'animation', 'grain', 'zerolatency']
+
+def _encode_video(input_path, output_path, duration, video_size_bytes, video_bitrate,
+                  audio_bitrate, preset, tune, use_nvenc, allow_crf=True):
+    """Build and run the ffmpeg pass(es) for one encoder, raising CalledProcessError on failure"""
+    crf = None
+    if use_nvenc:
+        if can_cuvid_decode(input_path):
+            # Decode on the GPU and keep frames in CUDA memory for NVENC
+            input_args = ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda', '-c:v', 'h264_cuvid']
+        else:
+            input_args = ['-hwaccel', 'cuda']
+        # -cq caps quality so VBR can spend less than the target bitrate on easy content
+        video_args = ['-c:v', 'h264_nvenc', '-preset', 'p5', '-rc', 'vbr', '-multipass', 'fullres', '-cq', '23']
+    else:
+        input_args = []
+        video_args = ['-c:v', 'libx264', '-preset', preset]
+        if tune:
+            video_args += ['-tune', tune]
+        video_args += ['-x264-params', 'sliced-threads=0:threads=auto']
+        
+        if allow_crf:
+            crf = choose_crf(input_path, duration, video_size_bytes, preset, tune)
+    
+    # A fitting CRF gives a single capped-CRF encode; otherwise fall back to bitrate targeting
+    if crf is not None:
+        rate_args = ['-crf', str(crf)]
+    else:
+        rate_args = ['-b:v', f'{video_bitrate}']
+    
+    base_cmd = [
+        'ffmpeg',
+        *input_args,
+        '-i', str(input_path),
+        '-map_metadata', '-1',  
+        *video_args,
+        '-threads', '0',
+        *rate_args,
+        '-maxrate', f'{int(video_bitrate * 1.5)}',
+        '-bufsize', f'{int(video_bitrate * 3)}',
+    ]
+    output_args = [
+        *get_audio_args(input_path, audio_bitrate),
+        '-movflags', '+faststart',  
+        '-y',                   
+        str(output_path)
+    ]
+    
+    if crf is not None:
+        print(f"Estimated CRF for target size: {crf}")
+    else:
+        print(f"Calculated video bitrate: {video_bitrate/1024:.2f}kbps")
+    print(f"Using video encoder: {video_args[1]}")
+    
+    # Per-invocation log dir so concurrent runs don't share ffmpeg2pass stats
+    with tempfile.TemporaryDirectory() as passlog_dir:
+        if use_nvenc:
+            # NVENC does its two passes internally via -multipass
+            passes = [base_cmd + output_args]
+        elif crf is not None:
+            # x264 rejects CRF with -pass, and the rate was already sampled
+            passes = [base_cmd + output_args]
+        else:
+            passlogfile = os.path.join(passlog_dir, 'ffmpeg2pass')
+            passes = [
+                base_cmd + ['-pass', '1', '-passlogfile', passlogfile, '-an', '-f', 'null', '-y', os.devnull],
+                base_cmd + ['-pass', '2', '-passlogfile', passlogfile] + output_args,
+            ]
+        
+        for cmd in passes:
+            run_ffmpeg(cmd, duration)
+    
+    # The CRF was estimated from the opening seconds and is only capped by -maxrate,
+    # so redo the encode with two-pass bitrate targeting if it overshot the size
+    target_size_bytes = video_size_bytes / 0.875
+    if crf is not None and output_path.stat().st_size > target_size_bytes * 1.05:
+        print(f"CRF {crf} overshot the target size, re-encoding with two-pass bitrate targeting...")
+        _encode_video(input_path, output_path, duration, video_size_bytes, video_bitrate,
+                      audio_bitrate, preset, tune, use_nvenc, allow_crf=False)
+
+def compress_video(input_file, target_size_mb=100, output_dir=None, preset='medium', tune=None):
     """Compress video to target size by adjusting bitrate"""
     input_path = Path(input_file).resolve()
     
@@ -44,27 +346,20 @@ def compress_video(input_file, target_size_mb=100, output_dir=None):
     video_bitrate = int((video_size_bytes * 8) / duration)
     audio_bitrate = "128k"  
     
-    cmd = [
-        'ffmpeg',
-        '-i', str(input_path),
-        '-map_metadata', '-1',  
-        '-c:v', 'libx264',      
-        '-preset', 'slow',      
-        '-b:v', f'{video_bitrate}',
-        '-maxrate', f'{int(video_bitrate * 1.5)}',
-        '-bufsize', f'{int(video_bitrate * 3)}',
-        '-c:a', 'aac',          
-        '-b:a', audio_bitrate,
-        '-movflags', '+faststart',  
-        '-y',                   
-        str(output_path)
-    ]
-    
     print(f"Compressing video to target size of {target_size_mb}MB...")
-    print(f"Calculated video bitrate: {video_bitrate/1024:.2f}kbps")
     
+    use_nvenc = has_nvenc()
     try:
-        subprocess.run(cmd, check=True)
+        try:
+            _encode_video(input_path, output_path, duration, video_size_bytes, video_bitrate,
+                          audio_bitrate, preset, tune, use_nvenc)
+        except subprocess.CalledProcessError as e:
+            if not use_nvenc:
+                raise
+            print(f"NVENC encode failed (exit status {e.returncode}), retrying with libx264...")
+            _encode_video(input_path, output_path, duration, video_size_bytes, video_bitrate,
+                          audio_bitrate, preset, tune, False)
+        
         output_size_mb = output_path.stat().st_size / (1024 * 1024)
         print(f"Compression complete: {output_path}")
         print(f"Output file size: {output_size_mb:.2f}MB")
@@ -82,9 +377,13 @@ def main():
     parser.add_argument('input_file', help='Path to the input video file')
     parser.add_argument('--target-size', type=int, default=100, 
                         help='Target size in MB (default: 100)')
+    parser.add_argument('--preset', choices=X264_PRESETS, default='medium',
+                        help='libx264 preset (default: medium)')
+    parser.add_argument('--tune', choices=X264_TUNES, default=None,
+                        help='libx264 tune for the source content, or zerolatency for streaming (default: none)')
     args = parser.parse_args()
     
-    result = compress_video(args.input_file, args.target_size)
+    result = compress_video(args.input_file, args.target_size, preset=args.preset, tune=args.tune)
     if result:
         print(f"Successfully compressed video to: {result}")
     else:
@@ -3,11 +3,15 @@
 import os
 import sys
 import re
+import io
+import functools
 from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 
-PAGE_PATTERNS = [r'page\.(js|jsx|ts|tsx)$']
-LAYOUT_PATTERNS = [r'layout\.(js|jsx|ts|tsx)$']
-DYNAMIC_ROUTE_PATTERN = r'\[(.+?)\]'
+PAGE_SUFFIXES = ('page.js', 'page.jsx', 'page.ts', 'page.tsx')
+LAYOUT_SUFFIXES = ('layout.js', 'layout.jsx', 'layout.ts', 'layout.tsx')
+DYNAMIC_ROUTE_RE = re.compile(r'\[(.+?)\]')
+NON_WORD_RE = re.compile(r'[^\w]')
 
 class NextjsNode:
     def __init__(self, name, path, node_type='folder'):
@@ -16,30 +20,39 @@ class NextjsNode:
         self.node_type = node_type
         self.children = []
         self.has_component = node_type in ['page', 'layout']
+        
+        clean_path = path.replace('/', '_').replace('.', '_').replace('-', '_')
+        self._mermaid_id = NON_WORD_RE.sub('_', clean_path)
     
     def add_child(self, child):
         self.children.append(child)
     
     def get_mermaid_id(self):
-        clean_path = self.path.replace('/', '_').replace('.', '_').replace('-', '_')
-        clean_path = re.sub(r'[^\w]', '_', clean_path)
-        return f"{clean_path}"
+        return self._mermaid_id
     
     def get_mermaid_label(self):
+        return self._mermaid_label
+    
+    def get_mermaid_style(self):
+        return self._mermaid_style
+    
+    @functools.cached_property
+    def _mermaid_label(self):
         if self.node_type == 'page':
             return f"{self.name}"
         elif self.node_type == 'layout':
             return f"{self.name}"
         elif self.node_type == 'dynamic':
-            param_name = re.search(DYNAMIC_ROUTE_PATTERN, self.name)
+            param_name = DYNAMIC_ROUTE_RE.search(self.name)
             if param_name:
                 return f"[{param_name.group(1)}]"
             return self.name
         else:
             return self.name
     
-    def get_mermaid_style(self):
-        node_id = self.get_mermaid_id()
+    @functools.cached_property
+    def _mermaid_style(self):
+        node_id = self._mermaid_id
         
         if self.node_type == 'page':
             return f"style {node_id} fill:#9f9,stroke:#6c6,stroke-width:1px"
@@ -49,25 +62,68 @@ class NextjsNode:
             return f"style {node_id} fill:#9cf,stroke:#69c,stroke-width:1px"
         else:
             return ""
-    
-    def has_component_in_subtree(self):
-        if self.has_component:
-            return True
-        
-        for child in self.children:
-            if child.has_component_in_subtree():
-                return True
-        
-        return False
 
 def is_page_file(filename):
-    return any(re.search(pattern, filename) for pattern in PAGE_PATTERNS)
+    return filename.endswith(PAGE_SUFFIXES)
 
 def is_layout_file(filename):
-    return any(re.search(pattern, filename) for pattern in LAYOUT_PATTERNS)
+    return filename.endswith(LAYOUT_SUFFIXES)
+
+def get_file_type(filename):
+    if is_page_file(filename):
+        return 'page'
+    if is_layout_file(filename):
+        return 'layout'
+    return None
 
 def is_dynamic_route(dirname):
-    return bool(re.search(DYNAMIC_ROUTE_PATTERN, dirname))
+    if '[' not in dirname or ']' not in dirname:
+        return False
+    return DYNAMIC_ROUTE_RE.search(dirname) is not None
+
+def _scan_directory(dir_path, node):
+    """Add the folders and page/layout files in dir_path as children of node, returning subdirectories to visit"""
+    try:
+        with os.scandir(dir_path) as it:
+            entries = list(it)
+    except OSError:
+        return []
+    
+    # Relative paths are built by concatenation instead of relpath per entry
+    prefix = node.path + os.sep if node.path else ''
+    dir_entries = []
+    file_entries = []
+    for entry in entries:
+        # DirEntry caches the d_type from getdents, so this does not re-stat
+        if entry.is_dir(follow_symlinks=False):
+            dir_entries.append(entry)
+        else:
+            file_entries.append(entry)
+    
+    subdirs = []
+    for entry in dir_entries:
+        child_path = prefix + entry.name
+        node_type = 'dynamic' if is_dynamic_route(entry.name) else 'folder'
+        child_node = NextjsNode(entry.name, child_path, node_type)
+        node.add_child(child_node)
+        subdirs.append((entry.path, child_node))
+    
+    for entry in file_entries:
+        node_type = get_file_type(entry.name)
+        if node_type:
+            child_path = prefix + entry.name
+            child_node = NextjsNode(entry.name, child_path, node_type)
+            node.add_child(child_node)
+    
+    return subdirs
+
+def _walk_subtree(dir_path, node):
+    # Each directory node is created once, when its parent is scanned, and is
+    # queued with its path so visiting it needs no lookup or re-creation.
+    pending = deque([(dir_path, node)])
+    
+    while pending:
+        pending.extend(_scan_directory(*pending.popleft()))
 
 def crawl_nextjs_project(root_path):
     if not os.path.exists(root_path):
@@ -77,91 +133,64 @@ def crawl_nextjs_project(root_path):
     root_name = os.path.basename(root_path)
     root = NextjsNode(root_name, root_name)
     
-    path_to_node = {root_name: root}
+    subdirs = _scan_directory(root_path, root)
+    if not subdirs:
+        return root
     
-    for dirpath, dirnames, filenames in os.walk(root_path):
-        rel_path = os.path.relpath(dirpath, os.path.dirname(root_path))
-        if rel_path == '.':
-            rel_path = root_name
-        
-        if rel_path in path_to_node:
-            current_node = path_to_node[rel_path]
-        else:
-            parent_path = os.path.dirname(rel_path)
-            dir_name = os.path.basename(rel_path)
-            
-            node_type = 'dynamic' if is_dynamic_route(dir_name) else 'folder'
-            current_node = NextjsNode(dir_name, rel_path, node_type)
-            
-            if parent_path in path_to_node:
-                path_to_node[parent_path].add_child(current_node)
-            
-            path_to_node[rel_path] = current_node
-        
-        for dirname in dirnames:
-            child_path = os.path.join(rel_path, dirname)
-            node_type = 'dynamic' if is_dynamic_route(dirname) else 'folder'
-            child_node = NextjsNode(dirname, child_path, node_type)
-            current_node.add_child(child_node)
-            path_to_node[child_path] = child_node
-        
-        for filename in filenames:
-            if is_page_file(filename) or is_layout_file(filename):
-                child_path = os.path.join(rel_path, filename)
-                node_type = 'page' if is_page_file(filename) else 'layout'
-                child_node = NextjsNode(filename, child_path, node_type)
-                current_node.add_child(child_node)
-                path_to_node[child_path] = child_node
+    # Walk each top-level directory on its own thread so scandir calls, which
+    # release the GIL, overlap on slow or network filesystems. Every subtree
+    # is already attached to root and only touched by its own thread.
+    max_workers = min(32, (os.cpu_count() or 1) * 4, len(subdirs))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_walk_subtree, *zip(*subdirs)))
     
     return root
 
+def _prune_subtree(node):
+    # Post-order: drop children without components, report whether any remain
+    node.children = [child for child in node.children if _prune_subtree(child)]
+    return node.has_component or bool(node.children)
+
 def prune_tree(node):
-    pruned_children = []
-    
-    for child in node.children:
-        if child.has_component_in_subtree():
-            pruned_child = prune_tree(child)
-            pruned_children.append(pruned_child)
-    
-    node.children = pruned_children
+    _prune_subtree(node)
     return node
 
 def generate_mermaid(root_node):
-    mermaid_lines = ["flowchart TD"]
-    edges = []
-    styles = []
+    # Each line is written with a leading newline so the output has no trailing one
+    buf = io.StringIO()
+    edges_buf = io.StringIO()
+    styles_buf = io.StringIO()
+    buf.write("flowchart TD")
     
+    # Nodes are marked visited when enqueued, so each one is queued at most once
     queue = deque([root_node])
-    visited = set()
+    visited = {id(root_node)}
     
     while queue:
         node = queue.popleft()
         node_id = node.get_mermaid_id()
         
-        if node_id in visited:
-            continue
-        
-        visited.add(node_id)
-        
-        mermaid_lines.append(f"    {node_id}[\"{node.get_mermaid_label()}\"]")
+        buf.write(f"\n    {node_id}[\"{node.get_mermaid_label()}\"]")
         
         style = node.get_mermaid_style()
         if style:
-            styles.append(f"    {style}")
+            styles_buf.write(f"\n    {style}")
         
+        edge_prefix = f"\n    {node_id} --> "
         for child in node.children:
-            child_id = child.get_mermaid_id()
-            edges.append(f"    {node_id} --> {child_id}")
-            queue.append(child)
-    
-    mermaid_lines.extend(edges)
-    mermaid_lines.extend(styles)
+            edges_buf.write(edge_prefix)
+            edges_buf.write(child.get_mermaid_id())
+            if id(child) not in visited:
+                visited.add(id(child))
+                queue.append(child)
     
-    return "\n".join(mermaid_lines)
+    return buf.getvalue() + edges_buf.getvalue() + styles_buf.getvalue()
 
 def save_to_file(content, filename="nextjs_project_structure.mmd"):
-    with open(filename, 'w') as f:
-        f.write(content)
+    # Encode once and write bytes: skips the locale-dependent text codec
+    # layer, and file names in labels are not guaranteed to be ASCII
+    with open(filename, 'wb') as f:
+        f.write(content.encode('utf-8'))
     print(f"Mermaid diagram saved to {filename}")
 
 def main():